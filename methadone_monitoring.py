@@ -1,80 +1,291 @@
+import math
+from functools import lru_cache
+
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
 import streamlit as st
 
+VOLUME_DISTRIBUTION = 4  # L/kg, valeur ajustée selon les données cliniques
+EDDP_RATIO = 0.3  # Rapport EDDP / méthadone attendu, ajusté pour éviter une surestimation
+# Grille de temps (h) sur laquelle sont tracées les courbes, identique à chaque exécution
+TIME_GRID = np.linspace(0, 48, 100)
+TIME_GRID.setflags(write=False)  # Tableau partagé : toute modification accidentelle lève une erreur
+# Demi-vies (h) des courbes de sensibilité tracées en arrière-plan, couvrant la plage du curseur
+SENSITIVITY_HALF_LIVES = np.linspace(10, 60, 6)
+SENSITIVITY_LABEL = f"Modèle, demi-vie de {SENSITIVITY_HALF_LIVES[0]:g} à {SENSITIVITY_HALF_LIVES[-1]:g} h"
+# Seuils de méthadonémie (ng/mL) tracés en lignes horizontales : (valeur, couleur, légende)
+THRESHOLDS = (
+    (100, 'green', 'Seuil bas (100 ng/mL)'),
+    (400, 'blue', 'Zone thérapeutique (400 ng/mL)'),
+    (600, 'red', 'Risque de toxicité (600 ng/mL)'),
+)
+
+@lru_cache(maxsize=256)
+def grid_decay(half_life):
+    """
+    Renvoie exp(-k * t) sur TIME_GRID pour une demi-vie donnée, mémorisé pour les demi-vies les plus récentes.
+    """
+    decay = np.multiply(-math.log(2) / half_life, TIME_GRID)
+    np.exp(decay, out=decay)
+    decay.setflags(write=False)  # Tableau partagé par le cache
+    return decay
+
 def calculate_methadone_concentration(dose, weight, half_life, time_since_last_dose, steady_state=True):
     """
     Estime la concentration de méthadone en fonction de la dose, du poids et du délai depuis la dernière prise.
+    N'accepte que des valeurs isolées (résultat mis en cache) ; pour un tableau de délais, utiliser calculate_methadone_concentrations.
+    """
+    if any(np.ndim(value) for value in (dose, weight, half_life, time_since_last_dose)):
+        raise TypeError("calculate_methadone_concentration attend des valeurs isolées ; utiliser calculate_methadone_concentrations pour un tableau de délais")
+    # Conversion en float : les tableaux 0-d et scalaires NumPy deviennent des clés de cache hachables
+    return _methadone_concentration(float(dose), float(weight), float(half_life), float(time_since_last_dose), bool(steady_state))
+
+@lru_cache(maxsize=4096)
+def _methadone_concentration(dose, weight, half_life, time_since_last_dose, steady_state):
+    """
+    Calcul scalaire mis en cache de calculate_methadone_concentration.
     """
-    volume_distribution = 4  # L/kg, valeur ajustée selon les données cliniques
-    clearance = (0.693 / half_life) * (volume_distribution * weight)
+    # Calcul scalaire avec le module math : pas de passage par les ufuncs NumPy pour une seule valeur
+    k = math.log(2) / half_life  # Constante d'élimination (h-1)
+    concentration = dose / (VOLUME_DISTRIBUTION * weight) * math.exp(-k * time_since_last_dose) * 1000  # Concentration pour une seule prise (ng/mL)
     
     if steady_state:
-        # Facteur d'accumulation basé sur un état d'équilibre après plusieurs jours (prise quotidienne)
-        accumulation_factor = 1 / (1 - np.exp(-0.693 * 24 / half_life))
-        concentration = (dose * accumulation_factor / (volume_distribution * weight)) * np.exp(-0.693 * time_since_last_dose / half_life)
-        
-        # Correction pour éviter les valeurs extrêmes
-        concentration = min(concentration * 1000, 400)  # Limité à 400 ng/mL max
-    else:
-        # Concentration pour une seule prise
-        concentration = (dose / (volume_distribution * weight)) * np.exp(-0.693 * time_since_last_dose / half_life) * 1000
+        # Facteur d'accumulation basé sur un état d'équilibre après plusieurs jours (prise quotidienne) ;
+        # expm1 évite la perte de précision de 1 - exp(-x) pour les demi-vies longues
+        concentration /= -math.expm1(-k * 24)
+        concentration = min(concentration, 400.0)  # Limité à 400 ng/mL max
     
-    return max(concentration, 0)  # Conversion en ng/mL et éviter les valeurs négatives
+    return max(concentration, 0.0)  # Éviter les valeurs négatives
+
+def _concentrations_from_decay(dose, weight, half_life, decay, steady_state):
+    """
+    Convertit un tableau de décroissance exp(-k * t) en concentrations de méthadone (ng/mL).
+    """
+    # Les facteurs scalaires sont combinés avant d'être appliqués au tableau de décroissance
+    k = math.log(2) / half_life  # Constante d'élimination (h-1)
+    scale = dose / (VOLUME_DISTRIBUTION * weight) * 1000
+    
+    if steady_state:
+        scale /= -math.expm1(-k * 24)
+    concentration = scale * decay
+    
+    # Bornage sur place, sans tableau temporaire supplémentaire (un délai isolé donne un scalaire NumPy, borné sans out=)
+    out = concentration if isinstance(concentration, np.ndarray) else None
+    if steady_state:
+        return np.clip(concentration, 0.0, 400.0, out=out)  # Bornée entre 0 et 400 ng/mL
+    return np.maximum(concentration, 0.0, out=out)
+
+def calculate_methadone_concentrations(dose, weight, half_life, times_since_last_dose, steady_state=True):
+    """
+    Estime les concentrations de méthadone pour un tableau de délais depuis la dernière prise (évaluation par lots, vectorisée) ;
+    un délai isolé est aussi accepté et donne une valeur isolée.
+    """
+    times = np.asarray(times_since_last_dose, dtype=float)
+    return _concentrations_from_decay(dose, weight, half_life, np.exp(-math.log(2) / half_life * times), steady_state)
+
+def methadone_curve(dose, weight, half_life, steady_state=True):
+    """
+    Calcule la courbe de concentration de méthadone sur TIME_GRID en une seule évaluation vectorisée.
+    """
+    return _concentrations_from_decay(dose, weight, half_life, grid_decay(half_life), steady_state)
+
+def half_life_sensitivity_curves(dose, weight):
+    """
+    Calcule les courbes attendues (état d'équilibre) sur TIME_GRID pour chaque demi-vie de SENSITIVITY_HALF_LIVES, en une seule évaluation vectorisée.
+    """
+    # Diffusion (demi-vies en colonne, temps en ligne) : un seul appel à np.exp pour toutes les courbes
+    k = np.log(2) / SENSITIVITY_HALF_LIVES[:, None]
+    scale = dose / (VOLUME_DISTRIBUTION * weight) * 1000 / -np.expm1(-k * 24)
+    # Un seul tableau (demi-vies x temps) alloué, puis calculé sur place
+    curves = np.multiply(-k, TIME_GRID)
+    np.exp(curves, out=curves)
+    curves *= scale
+    return np.clip(curves, 0.0, 400.0, out=curves)
 
 def calculate_eddp_concentration(methadone_expected):
     """
     Estime la concentration attendue d'EDDP en fonction de la méthadonémie attendue.
     """
-    expected_eddp = methadone_expected * 0.3  # Ratio ajusté pour éviter une surestimation
-    return expected_eddp
+    return methadone_expected * EDDP_RATIO
+
+# Intervalles normaux (bornes incluses) du tableau de classification du métabolisme (ng/mL)
+METHADONE_EDGES = (100, 400)
+EDDP_EDGES = (30, 300)
+UNCLASSIFIED_PROFILE = "Interprétation non concluante"
+# Profils du tableau indexés par (classe de méthadone, classe d'EDDP) ; les autres combinaisons ne sont pas concluantes
+METABOLISM_PROFILES = {
+    (1, 1): "Réponse normale",
+    (0, 2): "Métabolisation rapide",
+    (2, 0): "Métabolisation lente",
+}
+# Libellés des profils ; leur indice sert de code entier pour le classement par lots
+PROFILE_LABELS = (UNCLASSIFIED_PROFILE, *METABOLISM_PROFILES.values())
+_profile_labels = np.array(PROFILE_LABELS, dtype=object)
+
+def _build_profile_codes():
+    """
+    Construit la table des profils sous forme de codes int8, pour classer plusieurs patients à la fois.
+    """
+    # Une ligne et une colonne de plus, toujours à 0 : la classe -1 (valeur manquante) y est indexée
+    profile_codes = np.zeros((len(METHADONE_EDGES) + 2, len(EDDP_EDGES) + 2), dtype=np.int8)
+    for code, (methadone_class, eddp_class) in enumerate(METABOLISM_PROFILES, start=1):
+        profile_codes[methadone_class, eddp_class] = code
+    return profile_codes
+
+_profile_codes = _build_profile_codes()
+
+def _class_index(value, edges):
+    """
+    Renvoie la classe d'une valeur (ou d'un tableau) par rapport à l'intervalle fermé [bas, haut] : 0 en dessous, 1 dedans, 2 au-dessus,
+    -1 pour une valeur manquante (NaN), qui n'est associée à aucun profil.
+    """
+    low, high = edges
+    classes = (value >= low) * 1 + (value > high) * 1
+    if np.ndim(value):
+        return np.where(np.isnan(value), -1, classes)
+    return -1 if value != value else classes
+
+def metabolism_profile_codes(methadone_measured, eddp_measured):
+    """
+    Renvoie le code du profil métabolique (indice dans PROFILE_LABELS) pour des tableaux de patients.
+    """
+    methadone_class = _class_index(np.asarray(methadone_measured), METHADONE_EDGES)
+    eddp_class = _class_index(np.asarray(eddp_measured), EDDP_EDGES)
+    return _profile_codes[methadone_class, eddp_class]
+
+def evaluate_metabolism_profile(methadone_measured, eddp_measured):
+    """
+    Classe le profil métabolique à partir de la méthadonémie et de l'EDDP mesurés (valeurs isolées ou tableaux de patients).
+    """
+    if np.isscalar(methadone_measured) and np.isscalar(eddp_measured):
+        key = (_class_index(methadone_measured, METHADONE_EDGES), _class_index(eddp_measured, EDDP_EDGES))
+        return METABOLISM_PROFILES.get(key, UNCLASSIFIED_PROFILE)
+    # Les libellés ne sont associés aux codes qu'en fin de calcul
+    return _profile_labels[metabolism_profile_codes(methadone_measured, eddp_measured)]
+
+@st.cache_data
+def compute_methadone_curves(dose, weight, half_life):
+    """
+    Calcule les courbes attendue (modèle) et du patient sur 48 h, ainsi que les courbes de sensibilité à la demi-vie ;
+    mises en cache car elles ne dépendent ni du moment du prélèvement ni de la méthadonémie mesurée.
+    """
+    time = TIME_GRID
+    expected_concentrations = methadone_curve(dose, weight, half_life, steady_state=True)
+    patient_concentrations = methadone_curve(dose, weight, half_life, steady_state=False)
+    sensitivity = half_life_sensitivity_curves(dose, weight)
+    return time, expected_concentrations, patient_concentrations, sensitivity
+
+@st.cache_resource
+def chart_background():
+    """
+    Construit une seule fois les éléments statiques du graphique : légende, axes et seuils de méthadonémie.
+    """
+    # Import différé : altair n'est chargé qu'au premier tracé, pas au démarrage du script
+    import altair as alt
+
+    legend = [
+        ("Courbe attendue (modèle)", 'blue'),
+        (SENSITIVITY_LABEL, 'lightgray'),
+        ("Courbe du patient (observée)", 'gray'),
+        *[(label, color) for _, color, label in THRESHOLDS],
+        ("Moment du prélèvement", 'purple'),
+        ("Méthadonémie mesurée", 'red'),
+    ]
+    labels, colors = zip(*legend)
+    color = alt.Color("serie:N", scale=alt.Scale(domain=list(labels), range=list(colors)), title=None)
+    x = alt.X("t:Q", title="Temps depuis la dernière prise (h)")
+    y = alt.Y("concentration:Q", title="Concentration de méthadone (ng/mL)")
+    thresholds = pd.DataFrame(THRESHOLDS, columns=["concentration", "couleur", "serie"])
+    threshold_layer = alt.Chart(thresholds).mark_rule(strokeDash=[5, 5]).encode(y=y, color=color)
+    return color, x, y, threshold_layer
+
+@st.cache_data(show_spinner=False)
+def build_methadone_chart(dose, weight, half_life, time_since_last_dose, methadone_measured):
+    """
+    Construit la spécification Vega-Lite du graphique ; mise en cache pour ne pas reconstruire ni revalider le graphique à entrées identiques.
+    """
+    import altair as alt
+
+    time, expected_concentrations, patient_concentrations, sensitivity = compute_methadone_curves(dose, weight, half_life)
+    
+    # Graphique Altair : les données sont envoyées au navigateur qui le dessine, sans rendu PNG côté serveur.
+    # Seules les courbes et le prélèvement dépendent des saisies ; le fond statique est réutilisé.
+    color, x, y, threshold_layer = chart_background()
+    curves = pd.DataFrame({
+        "t": time,
+        "Courbe attendue (modèle)": expected_concentrations,
+        "Courbe du patient (observée)": patient_concentrations,
+    })
+    # Les deux courbes sont envoyées en colonnes et dépliées par le navigateur (transform_fold)
+    curve_layer = alt.Chart(curves).transform_fold(
+        ["Courbe attendue (modèle)", "Courbe du patient (observée)"], as_=["serie", "concentration"]
+    ).mark_line().encode(
+        x=x, y=y, color=color,
+        strokeDash=alt.condition(alt.datum.serie == "Courbe du patient (observée)", alt.value([5, 5]), alt.value([1, 0])),
+    )
+    # Faisceau de courbes du modèle pour toute la plage de demi-vies, en arrière-plan
+    fan = pd.DataFrame({
+        "t": np.tile(time, len(SENSITIVITY_HALF_LIVES)),
+        "demi_vie": np.repeat(SENSITIVITY_HALF_LIVES, len(time)),
+        "concentration": sensitivity.ravel(),
+        "serie": SENSITIVITY_LABEL,
+    })
+    fan_layer = alt.Chart(fan).mark_line().encode(
+        x=x, y=y, color=color, detail="demi_vie:N", tooltip=alt.Tooltip("demi_vie:Q", title="Demi-vie (h)"),
+    )
+    sample = pd.DataFrame({"t": [time_since_last_dose], "concentration": [methadone_measured]})
+    sample_time_layer = alt.Chart(sample.assign(serie="Moment du prélèvement")).mark_rule(strokeDash=[5, 5]).encode(x=x, color=color)
+    measured_layer = alt.Chart(sample.assign(serie="Méthadonémie mesurée")).mark_circle(size=80, opacity=1).encode(x=x, y=y, color=color)
+    
+    chart = alt.layer(fan_layer, curve_layer, threshold_layer, sample_time_layer, measured_layer).properties(
+        title="Courbes pharmacocinétiques : Patient vs Modèle"
+    )
+    return chart.to_dict()
 
 def plot_methadone_curves(dose, weight, half_life, time_since_last_dose, methadone_measured):
     """
     Trace les courbes pharmacocinétiques de la méthadone pour le patient et une courbe attendue (modèle).
     """
-    time = np.linspace(0, 48, 100)
-    expected_concentrations = np.array([calculate_methadone_concentration(dose, weight, half_life, t, steady_state=True) for t in time])
-    patient_concentrations = np.array([calculate_methadone_concentration(dose, weight, half_life, t, steady_state=False) for t in time])
-    
-    # Trouver la valeur attendue à l'instant du prélèvement
-    idx = np.argmin(np.abs(time - time_since_last_dose))
-    expected_at_sample = expected_concentrations[idx]
+    # Valeur attendue à l'instant exact du prélèvement (calcul scalaire, sans passer par la grille de temps)
+    expected_at_sample = calculate_methadone_concentration(dose, weight, half_life, time_since_last_dose, steady_state=True)
     
-    fig, ax = plt.subplots()
-    ax.plot(time, expected_concentrations, label="Courbe attendue (modèle)", color='blue')
-    ax.plot(time, patient_concentrations, label="Courbe du patient (observée)", linestyle='dashed', color='gray')
-    ax.axhline(100, color='green', linestyle='--', label='Seuil bas (100 ng/mL)')
-    ax.axhline(400, color='blue', linestyle='--', label='Zone thérapeutique (400 ng/mL)')
-    ax.axhline(600, color='red', linestyle='--', label='Risque de toxicité (600 ng/mL)')
-    ax.axvline(time_since_last_dose, color='purple', linestyle='--', label='Moment du prélèvement')
-    ax.scatter([time_since_last_dose], [methadone_measured], color='red', label='Méthadonémie mesurée')
-    ax.set_xlabel("Temps depuis la dernière prise (h)")
-    ax.set_ylabel("Concentration de méthadone (ng/mL)")
-    ax.set_title("Courbes pharmacocinétiques : Patient vs Modèle")
-    ax.legend()
-    st.pyplot(fig)
+    st.vega_lite_chart(build_methadone_chart(dose, weight, half_life, time_since_last_dose, methadone_measured))
     
-    return expected_at_sample, calculate_eddp_concentration(expected_at_sample)
-
-# Interface Streamlit
-st.title("Évaluation de la Méthadonémie")
-
-dose = st.number_input("Dose quotidienne de méthadone (mg)", min_value=1, max_value=300, value=60)
-weight = st.number_input("Poids du patient (kg)", min_value=30, max_value=150, value=70)
-half_life = st.slider("Demi-vie de la méthadone (h)", min_value=10, max_value=60, value=36)
-time_since_last_dose = st.number_input("Temps depuis la dernière prise (h)", min_value=1, max_value=48, value=12)
-methadone_measured = st.number_input("Méthadonémie mesurée (ng/mL)", min_value=0, max_value=2000, value=350)
-eddp_measured = st.number_input("EDDP mesuré (ng/mL)", min_value=0, max_value=2000, value=120)
-
-if st.button("Évaluer"):
-    expected_methadone, expected_eddp = plot_methadone_curves(dose, weight, half_life, time_since_last_dose, methadone_measured)
-    st.write(f"**Méthadonémie attendue**: {expected_methadone:.2f} ng/mL")
-    st.write(f"**EDDP attendu**: {expected_eddp:.2f} ng/mL")
+    return expected_at_sample, expected_at_sample * EDDP_RATIO
+
+# Tableau de classification du métabolisme (statique, construit une seule fois au chargement du module)
+METABOLISM_CLASSIFICATION_TABLE = pd.DataFrame(
+    [
+        ("Réponse normale", "100-400 ng/mL", "30-300 ng/mL", "Métabolisation standard"),
+        ("Métabolisation rapide", "< 100 ng/mL", "> 300 ng/mL", "Fort métabolisme hépatique → risque de manque en fin de journée → besoin de dose fractionnée"),
+        ("Métabolisation lente", "> 400-600 ng/mL", "< 30 ng/mL", "Accumulation de méthadone → risque de sédation et QT long → réduire la dose"),
+    ],
+    columns=["Situation clinique", "Méthadone plasmatique", "EDDP", "Interprétation"],
+).set_index("Situation clinique")
+
+def main():
+    """
+    Interface Streamlit ; séparée des calculs pour que le module puisse être importé (évaluation par lots) sans lancer l'interface.
+    """
+    st.title("Évaluation de la Méthadonémie")
+
+    # Les saisies sont regroupées dans un formulaire : le script n'est réexécuté qu'à la validation
+    with st.form("inputs"):
+        dose = st.number_input("Dose quotidienne de méthadone (mg)", min_value=1, max_value=300, value=60)
+        weight = st.number_input("Poids du patient (kg)", min_value=30, max_value=150, value=70)
+        half_life = st.slider("Demi-vie de la méthadone (h)", min_value=10, max_value=60, value=36)
+        time_since_last_dose = st.number_input("Temps depuis la dernière prise (h)", min_value=1, max_value=48, value=12)
+        methadone_measured = st.number_input("Méthadonémie mesurée (ng/mL)", min_value=0, max_value=2000, value=350)
+        eddp_measured = st.number_input("EDDP mesuré (ng/mL)", min_value=0, max_value=2000, value=120)
+        submitted = st.form_submit_button("Évaluer")
+
+    if submitted:
+        expected_methadone, expected_eddp = plot_methadone_curves(dose, weight, half_life, time_since_last_dose, methadone_measured)
+        st.write(f"**Méthadonémie attendue**: {expected_methadone:.2f} ng/mL")
+        st.write(f"**EDDP attendu**: {expected_eddp:.2f} ng/mL")
     
-    st.write("## Tableau de classification du métabolisme")
-    st.write("| Situation clinique | Méthadone plasmatique | EDDP | Interprétation |")
-    st.write("|-------------------|----------------------|------|----------------|")
-    st.write("| **Réponse normale** | 100-400 ng/mL | 30-300 ng/mL | Métabolisation standard |")
-    st.write("| **Métabolisation rapide** | < 100 ng/mL | > 300 ng/mL | Fort métabolisme hépatique → risque de manque en fin de journée → besoin de dose fractionnée |")
-    st.write("| **Métabolisation lente** | > 400-600 ng/mL | < 30 ng/mL | Accumulation de méthadone → risque de sédation et QT long → réduire la dose |")
+        st.write("## Tableau de classification du métabolisme")
+        st.table(METABOLISM_CLASSIFICATION_TABLE)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from methadone_monitoring import (
+    PROFILE_LABELS,
+    SENSITIVITY_HALF_LIVES,
+    SENSITIVITY_LABEL,
+    build_methadone_chart,
+    calculate_methadone_concentration,
+    calculate_methadone_concentrations,
+    evaluate_metabolism_profile,
+    half_life_sensitivity_curves,
+    metabolism_profile_codes,
+    methadone_curve,
+)
+
+
+def test_metabolism_profile_codes_closed_interval_bounds():
+    methadone = np.array([99, 100, 400, 401])
+    eddp = np.array([29, 30, 300, 301])
+    codes = metabolism_profile_codes(methadone[:, None], eddp[None, :])
+    labels = np.array(PROFILE_LABELS, dtype=object)[codes]
+    # Réponse normale sur tout [100, 400] x [30, 300], bornes comprises
+    assert (labels[1:3, 1:3] == "Réponse normale").all()
+    assert labels[0, 3] == "Métabolisation rapide"
+    assert labels[3, 0] == "Métabolisation lente"
+    assert labels[0, 0] == "Interprétation non concluante"
+    assert labels[3, 3] == "Interprétation non concluante"
+
+
+def test_evaluate_metabolism_profile_array_matches_table_bounds():
+    labels = evaluate_metabolism_profile(np.array([400, 250, 400, 99, 401]), np.array([100, 300, 300, 301, 29]))
+    assert list(labels) == [
+        "Réponse normale",
+        "Réponse normale",
+        "Réponse normale",
+        "Métabolisation rapide",
+        "Métabolisation lente",
+    ]
+
+
+def test_evaluate_metabolism_profile_scalar_matches_array_path():
+    for methadone in (99, 100, 400, 401):
+        for eddp in (29, 30, 300, 301):
+            expected = evaluate_metabolism_profile(np.array([methadone]), np.array([eddp]))[0]
+            assert evaluate_metabolism_profile(methadone, eddp) == expected
+    assert evaluate_metabolism_profile(400, 100) == "Réponse normale"
+    assert evaluate_metabolism_profile(400, 300) == "Réponse normale"
+
+
+def test_calculate_methadone_concentrations_matches_scalar_path():
+    times = np.array([0.0, 5.5, 12.0, 30.25, 48.0])
+    for steady_state in (True, False):
+        concentrations = calculate_methadone_concentrations(60, 70, 36, times, steady_state=steady_state)
+        expected = [calculate_methadone_concentration(60, 70, 36, float(t), steady_state=steady_state) for t in times]
+        np.testing.assert_allclose(concentrations, expected)
+
+
+def test_calculate_methadone_concentration_rejects_arrays():
+    with pytest.raises(TypeError, match="calculate_methadone_concentrations"):
+        calculate_methadone_concentration(60, 70, 36, np.array([1.0, 2.0]))
+    with pytest.raises(TypeError, match="calculate_methadone_concentrations"):
+        calculate_methadone_concentration(np.array([60, 80]), 70, 36, 12)
+
+
+def test_calculate_methadone_concentration_accepts_numpy_scalars():
+    expected = calculate_methadone_concentration(60, 70, 36, 12)
+    assert calculate_methadone_concentration(np.array(60), np.float64(70), np.int64(36), np.array(12.0)) == expected
+
+
+def test_evaluate_metabolism_profile_missing_values_are_unclassified():
+    assert evaluate_metabolism_profile(np.nan, 400) == "Interprétation non concluante"
+    assert evaluate_metabolism_profile(250, float("nan")) == "Interprétation non concluante"
+    labels = evaluate_metabolism_profile(np.array([np.nan, 50, 250, np.nan]), np.array([400, np.nan, 120, np.nan]))
+    assert list(labels) == ["Interprétation non concluante"] * 2 + ["Réponse normale", "Interprétation non concluante"]
+    assert (metabolism_profile_codes(np.array([np.nan, 500]), np.array([10, np.nan])) == 0).all()
+
+
+def test_calculate_methadone_concentrations_accepts_scalar_times():
+    for t in (12.0, np.float64(12), np.array(12.0)):
+        for steady_state in (True, False):
+            concentration = calculate_methadone_concentrations(60, 70, 36, t, steady_state=steady_state)
+            assert np.ndim(concentration) == 0
+            assert concentration == pytest.approx(calculate_methadone_concentration(60, 70, 36, 12.0, steady_state=steady_state))
+
+
+def test_half_life_sensitivity_curves_match_individual_curves():
+    curves = half_life_sensitivity_curves(60, 70)
+    assert curves.shape == (len(SENSITIVITY_HALF_LIVES), 100)
+    for row, half_life in zip(curves, SENSITIVITY_HALF_LIVES):
+        np.testing.assert_allclose(row, methadone_curve(60, 70, half_life, steady_state=True), rtol=1e-12)
+
+
+def test_build_methadone_chart_includes_sensitivity_layer():
+    spec = build_methadone_chart(60, 70, 36, 12, 350)
+    fan_layers = [layer for layer in spec["layer"] if layer.get("encoding", {}).get("detail", {}).get("field") == "demi_vie"]
+    assert len(fan_layers) == 1
+    fan_rows = spec["datasets"][fan_layers[0]["data"]["name"]]
+    assert len(fan_rows) == len(SENSITIVITY_HALF_LIVES) * 100
+    assert {row["serie"] for row in fan_rows} == {SENSITIVITY_LABEL}